@@ -1,18 +1,44 @@
 from __future__ import annotations
 
-import json
+import atexit
+import hashlib
+import logging
+import mimetypes
 import os
+import queue
+import re
 import sqlite3
-from datetime import datetime, timedelta
-from functools import wraps
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from datetime import datetime, timedelta, timezone
+from functools import cache, lru_cache, wraps
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from urllib.parse import quote
 
 from flask import (
     Flask,
+    Request,
+    Response,
     abort,
     flash,
+    g,
+    has_app_context,
     jsonify,
+    make_response,
     redirect,
     render_template,
     request,
@@ -20,9 +46,13 @@ from flask import (
     session,
     url_for,
 )
+from werkzeug.formparser import FormDataParser, MultiPartParser
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-from openai import OpenAI
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+import orjson
+from pydantic import BaseModel, ConfigDict, ValidationError, field_validator
 from supabase import Client, create_client
 
 
@@ -33,6 +63,21 @@ RUNTIME_ROOT = Path("/tmp/hiremote") if IS_VERCEL else APP_ROOT
 INSTANCE_PATH = RUNTIME_ROOT / "instance"
 DATABASE_PATH = INSTANCE_PATH / "hiremote.db"
 UPLOAD_ROOT = RUNTIME_ROOT / "storage" / "uploads"
+UPLOAD_ROOT_RESOLVED = UPLOAD_ROOT.resolve()
+# Multipart file parts are spooled here while the request is parsed; it sits
+# on the same filesystem as UPLOAD_ROOT so saving an upload is a rename.
+UPLOAD_SPOOL_ROOT = RUNTIME_ROOT / "storage" / "incoming"
+# Werkzeug reads upload bodies in 64 KiB chunks and copies files in 16 KiB
+# ones, which is thousands of Python-level iterations for one shift video.
+# The parse chunk must stay below Flask's MAX_FORM_MEMORY_SIZE (500 KB), or
+# the multipart decoder rejects the request with a 413.
+UPLOAD_PARSE_BUFFER_SIZE = 256 * 1024
+UPLOAD_COPY_BUFFER_SIZE = 1024 * 1024
+# When set (e.g. "/protected/"), downloads are handed to nginx through an
+# internal location that serves UPLOAD_ROOT instead of streaming via Python.
+UPLOAD_ACCEL_PREFIX = os.environ.get("UPLOAD_ACCEL_PREFIX", "")
+# Stored uploads never change, so browsers may keep them (privately) a while.
+UPLOAD_CACHE_MAX_AGE = 60 * 60 * 24
 
 ALLOWED_EXTENSIONS = {
     "png",
@@ -47,20 +92,143 @@ ALLOWED_EXTENSIONS = {
     "docx",
     "txt",
 }
+_ALLOWED_FILE_RE = re.compile(
+    r"\.(?:%s)$" % "|".join(sorted(ALLOWED_EXTENSIONS)), re.IGNORECASE
+)
+
+# Columns read by summarize_submissions(); skips the payload JSON blob.
+SUMMARY_COLUMNS = (
+    "category",
+    "report_type",
+    "employee_name",
+    "store_number",
+    "notes",
+    "created_at",
+)
+
+# User fields copied into the signed session cookie at login.
+SESSION_USER_KEYS = ("name", "role", "store_number")
 
 ROLE_EMPLOYEE = "employee"
 ROLE_IRONHAND = "ironhand"
 ROLE_CLIENT = "client"
 PASSWORD_METHOD = "pbkdf2:sha256"
+# Seeded demo accounts are hashed on every cold start (each Vercel boot), so
+# use fewer PBKDF2 rounds than the default for them.
+SEED_PASSWORD_METHOD = "pbkdf2:sha256:50000"
+REPORTS_PAGE_SIZE = 50
+REPORTS_MAX_PAGE_SIZE = 200
 AI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-5-mini")
-AI_MAX_CONTEXT_ITEMS = int(os.environ.get("AI_MAX_CONTEXT_ITEMS", "6"))
+# History is trimmed to fit AI_MAX_INPUT_TOKENS; AI_MAX_CONTEXT_ITEMS only
+# bounds how many turns the server will look at.
+AI_MAX_CONTEXT_ITEMS = int(os.environ.get("AI_MAX_CONTEXT_ITEMS", "20"))
+AI_MAX_INPUT_TOKENS = int(os.environ.get("AI_MAX_INPUT_TOKENS", "6000"))
+AI_TIMEOUT_SECONDS = float(os.environ.get("AI_TIMEOUT_SECONDS", "30"))
+# Retries for rate limits, timeouts, connection errors and 5xx responses.
+AI_MAX_RETRIES = int(os.environ.get("AI_MAX_RETRIES", "3"))
+# The SDK applies AI_TIMEOUT_SECONDS to each attempt, so a non-streamed call
+# can take every attempt timing out plus the backoff between them (0.5 s
+# doubling, capped at 8 s). A Retry-After header can stretch the backoff.
+AI_CALL_DEADLINE = AI_TIMEOUT_SECONDS * (AI_MAX_RETRIES + 1) + sum(
+    min(0.5 * 2**attempt, 8.0) for attempt in range(AI_MAX_RETRIES)
+)
+# First-turn replies are shared between identical questions from one store.
+AI_REPLY_CACHE_TTL = float(os.environ.get("AI_REPLY_CACHE_TTL", "30"))
+AI_REPLY_CACHE_SIZE = 1024
+# X-Accel-Buffering stops nginx from holding streamed replies until they end.
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+# Questions the store context answers exactly are replied to locally. The
+# patterns must match the whole (normalized) message, so anything with an
+# extra qualifier ("today's sales", "sales by hour") still goes to OpenAI.
+_INTENT_PREFIX = (
+    r"(?:(?:what|how much) (?:are|were|was|is) |show(?: me)? |tell me |list )?"
+    r"(?:the |our |my |store )*"
+)
+_INTENT_WINDOW = (
+    r"(?: (?:for|in|over|during) (?:the )?(?:last|past) (?:30 days|month))?"
+)
+_INTENT_PATTERNS: Tuple[Tuple[str, "re.Pattern[str]"], ...] = (
+    (
+        "sales",
+        re.compile(
+            _INTENT_PREFIX
+            + r"(?:total |gross |net )?(?:sales|revenue)"
+            + _INTENT_WINDOW
+        ),
+    ),
+    (
+        "transactions",
+        re.compile(
+            r"(?:how many |what (?:is|was|are|were) (?:the |our )?)?"
+            r"(?:total |number of )*(?:transactions|items sold)" + _INTENT_WINDOW
+        ),
+    ),
+    (
+        "top_items",
+        re.compile(
+            _INTENT_PREFIX
+            + r"(?:top|best)(?:[- ]selling)? (?:items|products|sellers)"
+            + _INTENT_WINDOW
+        ),
+    ),
+    (
+        "recent_activity",
+        re.compile(
+            _INTENT_PREFIX
+            + r"(?:recent|latest|last few) (?:reports|submissions|uploads|activity)"
+        ),
+    ),
+)
+AI_SYSTEM_PROMPT = (
+    "You are the Iron Hand store assistant. Answer only using the provided "
+    "store context. If the answer is not available, say you do not have that "
+    "data yet and suggest what data would be needed. Keep responses concise "
+    "and action-oriented."
+)
 POS_DAILY_TABLE = os.environ.get("POS_DAILY_TABLE", "pos_daily_sales")
 POS_ITEM_TABLE = os.environ.get("POS_ITEM_TABLE", "pos_item_sales")
 POS_DATE_COLUMN = os.environ.get("POS_DATE_COLUMN", "business_date")
 POS_ITEM_DATE_COLUMN = os.environ.get("POS_ITEM_DATE_COLUMN", "business_date")
-
-_SUPABASE_CLIENT: Optional[Client] = None
-_OPENAI_CLIENT: Optional[OpenAI] = None
+# Postgres functions from supabase/migrations; set to "" to always aggregate
+# the raw rows in Python.
+POS_SUMMARY_RPC = os.environ.get("POS_SUMMARY_RPC", "pos_summary")
+POS_TOP_ITEMS_RPC = os.environ.get("POS_TOP_ITEMS_RPC", "pos_top_items")
+POS_CACHE_TTL = int(os.environ.get("POS_CACHE_TTL", "300"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+SUBMISSION_BATCH_SIZE = 100
+SUBMISSION_FLUSH_INTERVAL = 0.1
+# Tries per row once a batch fails; only "database is locked"-style errors
+# are retried.
+SUBMISSION_WRITE_ATTEMPTS = 3
+
+_DB_POOL: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=DB_POOL_SIZE)
+# SQLite allows one writer at a time, so every write goes through a single
+# connection guarded by a lock while the pooled connections above only read.
+_DB_WRITER: Optional[sqlite3.Connection] = None
+_DB_WRITE_LOCK = threading.Lock()
+# Handles inherited across fork(); kept referenced so they are never closed
+# (and never checkpoint the parent's WAL) from the child.
+_INHERITED_DB_CONNECTIONS: List[sqlite3.Connection] = []
+logger = logging.getLogger(__name__)
+# Submission rows waiting for the writer thread; None asks it to stop.
+_SUBMISSION_QUEUE: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue()
+_SUBMISSION_WRITER: Optional[threading.Thread] = None
+_SUBMISSION_WRITER_LOCK = threading.RLock()
+# Set at interpreter exit; later submissions are written inline.
+_SUBMISSIONS_CLOSED = False
+# (store_id, window_start) -> (expires_at, summary)
+_POS_SUMMARY_CACHE: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+_POS_SUMMARY_LOCK = threading.Lock()
+# Runs the second of the two independent Supabase queries behind a POS summary
+# so they overlap. Tasks never wait on other tasks, so the pool cannot deadlock.
+_POS_QUERY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=4, thread_name_prefix="hiremote-pos"
+)
+# key -> (expires_at, reply); _REPLY_INFLIGHT holds one event per question
+# that is currently being answered so duplicates wait instead of calling out.
+_REPLY_CACHE: Dict[str, Tuple[float, str]] = {}
+_REPLY_INFLIGHT: Dict[str, threading.Event] = {}
+_REPLY_LOCK = threading.Lock()
 
 DEFAULT_USERS = [
     {
@@ -87,6 +255,65 @@ DEFAULT_USERS = [
 ]
 
 
+class UploadFormDataParser(FormDataParser):
+    """Multipart parser that reads the request body in larger chunks."""
+
+    def _parse_multipart(
+        self,
+        stream: Any,
+        mimetype: str,
+        content_length: Optional[int],
+        options: Dict[str, str],
+    ):
+        parser = MultiPartParser(
+            stream_factory=self.stream_factory,
+            max_form_memory_size=self.max_form_memory_size,
+            max_form_parts=self.max_form_parts,
+            cls=self.cls,
+            buffer_size=UPLOAD_PARSE_BUFFER_SIZE,
+        )
+        boundary = options.get("boundary", "").encode("ascii")
+        if not boundary:
+            raise ValueError("Missing boundary")
+        form, files = parser.parse(stream, boundary, content_length)
+        return stream, form, files
+
+
+class UploadRequest(Request):
+    """Request that writes multipart file parts straight to disk.
+
+    Werkzeug keeps small parts in memory and larger ones in an anonymous
+    temp file that ``FileStorage.save`` then copies again. Spooling into
+    ``UPLOAD_SPOOL_ROOT`` instead lets ``save_uploaded_files`` move the
+    finished part into place; anything not claimed is removed on close.
+    """
+
+    form_data_parser_class = UploadFormDataParser
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.upload_spools: List[str] = []
+
+    def _get_file_stream(
+        self,
+        total_content_length: Optional[int],
+        content_type: Optional[str],
+        filename: Optional[str] = None,
+        content_length: Optional[int] = None,
+    ):
+        spool = tempfile.NamedTemporaryFile(
+            dir=UPLOAD_SPOOL_ROOT, prefix="upload-", delete=False
+        )
+        self.upload_spools.append(spool.name)
+        return spool
+
+    def close(self) -> None:
+        super().close()
+        for name in self.upload_spools:
+            with suppress(FileNotFoundError):
+                os.unlink(name)
+
+
 def create_app() -> Flask:
     app = Flask(
         __name__,
@@ -95,61 +322,165 @@ def create_app() -> Flask:
         static_folder="static",
         template_folder="templates",
     )
+    app.request_class = UploadRequest
     app.config.update(
         SECRET_KEY=os.environ.get("HIREMOTE_SECRET", "change-me"),
         MAX_CONTENT_LENGTH=512 * 1024 * 1024,  # 512 MB uploads
         PERMANENT_SESSION_LIFETIME=60 * 60 * 10,
         UPLOAD_FOLDER=str(UPLOAD_ROOT),
+        # Apache (mod_xsendfile) / lighttpd: send_from_directory answers with
+        # an X-Sendfile header and the server streams the file.
+        USE_X_SENDFILE=os.environ.get("USE_X_SENDFILE") == "1",
     )
 
     INSTANCE_PATH.mkdir(parents=True, exist_ok=True)
     UPLOAD_ROOT.mkdir(parents=True, exist_ok=True)
+    UPLOAD_SPOOL_ROOT.mkdir(parents=True, exist_ok=True)
+
+    app.teardown_appcontext(release_db_connection)
+    with app.app_context():
+        init_db()
+        seed_users()
+    # Don't carry startup connections into forked workers (gunicorn
+    # --preload); each process opens its own on first use.
+    close_db_connections()
 
-    init_db()
-    seed_users()
+    if not IS_VERCEL:
+        threading.Thread(target=warm_supabase_client, daemon=True).start()
+        start_submission_writer()
 
     register_routes(app)
     return app
 
 
-def get_db_connection() -> sqlite3.Connection:
-    conn = sqlite3.connect(DATABASE_PATH)
+def open_db_connection(read_only: bool = False) -> sqlite3.Connection:
+    # Connections are pooled and shared across worker threads, so run in
+    # autocommit mode and let WAL keep readers and the writer out of each
+    # other's way.
+    conn = sqlite3.connect(
+        DATABASE_PATH, check_same_thread=False, isolation_level=None
+    )
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-64000")
+    conn.execute("PRAGMA busy_timeout=5000")
+    if read_only:
+        conn.execute("PRAGMA query_only=1")
     return conn
 
 
+def get_db_connection() -> sqlite3.Connection:
+    if "db" not in g:
+        try:
+            g.db = _DB_POOL.get_nowait()
+        except queue.Empty:
+            g.db = open_db_connection(read_only=True)
+    return g.db
+
+
+@contextmanager
+def db_transaction() -> Iterator[sqlite3.Connection]:
+    global _DB_WRITER
+    with _DB_WRITE_LOCK:
+        if _DB_WRITER is None:
+            _DB_WRITER = open_db_connection()
+        conn = _DB_WRITER
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+
+def release_db_connection(exc: Optional[BaseException] = None) -> None:
+    conn = g.pop("db", None)
+    if conn is None:
+        return
+    if conn.in_transaction:
+        conn.rollback()
+    try:
+        _DB_POOL.put_nowait(conn)
+    except queue.Full:
+        conn.close()
+
+
+def close_db_connections() -> None:
+    global _DB_WRITER
+    with _DB_WRITE_LOCK:
+        if _DB_WRITER is not None:
+            _DB_WRITER.close()
+            _DB_WRITER = None
+    with suppress(queue.Empty):
+        while True:
+            _DB_POOL.get_nowait().close()
+
+
+def _abandon_inherited_db_connections() -> None:
+    # SQLite connections must not be used across fork(): the POSIX locks and
+    # WAL shared memory belong to the parent. Start the child with none.
+    global _DB_POOL, _DB_WRITER, _DB_WRITE_LOCK
+    if _DB_WRITER is not None:
+        _INHERITED_DB_CONNECTIONS.append(_DB_WRITER)
+    # Read the deque directly: the queue's lock may have been held at fork.
+    _INHERITED_DB_CONNECTIONS.extend(_DB_POOL.queue)
+    _DB_POOL = queue.Queue(maxsize=DB_POOL_SIZE)
+    _DB_WRITER = None
+    _DB_WRITE_LOCK = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_abandon_inherited_db_connections)
+
+
 def init_db() -> None:
-    conn = get_db_connection()
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            role TEXT NOT NULL,
-            store_number TEXT NOT NULL
+    with db_transaction() as conn:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                email TEXT UNIQUE NOT NULL,
+                password_hash TEXT NOT NULL,
+                role TEXT NOT NULL,
+                store_number TEXT NOT NULL
+            )
+            """
         )
-        """
-    )
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS submissions (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            employee_name TEXT NOT NULL,
-            store_number TEXT NOT NULL,
-            category TEXT NOT NULL,
-            report_type TEXT,
-            notes TEXT,
-            payload TEXT,
-            created_at TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                employee_name TEXT NOT NULL,
+                store_number TEXT NOT NULL,
+                category TEXT NOT NULL,
+                report_type TEXT,
+                notes TEXT,
+                payload TEXT,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (user_id) REFERENCES users (id)
+            )
+            """
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_sub_store_cat_created
+            ON submissions (store_number, category, created_at DESC)
+            """
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sub_employee ON submissions (employee_name)"
+        )
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_sub_store_employee_created
+            ON submissions (store_number, employee_name, created_at DESC)
+            """
         )
-        """
-    )
-    conn.commit()
-    conn.close()
 
 
 def seed_users() -> None:
@@ -157,25 +488,28 @@ def seed_users() -> None:
     existing_users = {
         row["email"] for row in conn.execute("SELECT email FROM users").fetchall()
     }
-
-    for user in DEFAULT_USERS:
-        if user["email"] in existing_users:
-            continue
-        conn.execute(
+    rows = [
+        (
+            user["name"],
+            user["email"].lower(),
+            generate_password_hash(user["password"], method=SEED_PASSWORD_METHOD),
+            user["role"],
+            user["store_number"],
+        )
+        for user in DEFAULT_USERS
+        if user["email"] not in existing_users
+    ]
+    if not rows:
+        return
+
+    with db_transaction() as conn:
+        conn.executemany(
             """
             INSERT INTO users (name, email, password_hash, role, store_number)
             VALUES (?, ?, ?, ?, ?)
             """,
-            (
-                user["name"],
-                user["email"].lower(),
-                generate_password_hash(user["password"], method=PASSWORD_METHOD),
-                user["role"],
-                user["store_number"],
-            ),
+            rows,
         )
-    conn.commit()
-    conn.close()
 
 
 def login_required(role: Optional[str] = None):
@@ -195,40 +529,137 @@ def login_required(role: Optional[str] = None):
     return decorator
 
 
-def current_user() -> Optional[sqlite3.Row]:
+def request_cached(key_fn: Optional[Callable[..., Hashable]] = None):
+    """Memoize a read helper for the rest of the current request.
+
+    Results live in ``g.query_cache`` keyed by function name plus
+    ``key_fn(*args, **kwargs)`` (default: the positional and keyword args,
+    which must be hashable), so repeated identical reads within one request
+    hit SQLite once.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if not has_app_context():
+                return func(*args, **kwargs)
+            if key_fn:
+                key = (func.__name__, key_fn(*args, **kwargs))
+            else:
+                key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            cache = g.setdefault("query_cache", {})
+            if key not in cache:
+                cache[key] = func(*args, **kwargs)
+            return cache[key]
+
+        return wrapped
+
+    return decorator
+
+
+def remember_user(user: sqlite3.Row) -> None:
+    # The session cookie is signed, so the identity the views need can ride
+    # along with the user id instead of being re-read from SQLite.
+    session["user_id"] = user["id"]
+    for key in SESSION_USER_KEYS:
+        session[key] = user[key]
+
+
+@request_cached()
+def current_user() -> Optional[Dict[str, Any]]:
+    # login_required, the view body and the context processor all ask for the
+    # user, so resolve it once per request.
     user_id = session.get("user_id")
     if not user_id:
         return None
-    conn = get_db_connection()
-    user = conn.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
-    conn.close()
+    if all(key in session for key in SESSION_USER_KEYS):
+        user = {"id": user_id, **{key: session[key] for key in SESSION_USER_KEYS}}
+    else:
+        # Sessions issued before the identity was stored in the cookie.
+        conn = get_db_connection()
+        row = conn.execute(
+            "SELECT id, name, role, store_number FROM users WHERE id = ?", (user_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        remember_user(row)
+        user = dict(row)
+    # OpenAI request metadata, formatted once alongside the identity.
+    user["ai_metadata"] = {
+        "store_id": str(user["store_number"]),
+        "user_id": str(user["id"]),
+    }
     return user
 
 
+@cache
 def get_openai_client() -> Optional[OpenAI]:
-    global _OPENAI_CLIENT
-    if _OPENAI_CLIENT is not None:
-        return _OPENAI_CLIENT
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         return None
-    _OPENAI_CLIENT = OpenAI(api_key=api_key)
-    return _OPENAI_CLIENT
+    # One client per process: its HTTP/2 keep-alive pool lets assistant turns
+    # reuse the TLS connection instead of handshaking each time.
+    http_client = DefaultHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_keepalive_connections=50, max_connections=100),
+        timeout=httpx.Timeout(AI_TIMEOUT_SECONDS, connect=5.0),
+    )
+    # The SDK retries transient failures with exponential backoff plus jitter
+    # (honouring Retry-After) and never retries 400/401/403-style errors.
+    return OpenAI(
+        api_key=api_key,
+        timeout=AI_TIMEOUT_SECONDS,
+        max_retries=AI_MAX_RETRIES,
+        http_client=http_client,
+    )
 
 
+@cache
 def get_supabase_client() -> Optional[Client]:
-    global _SUPABASE_CLIENT
-    if _SUPABASE_CLIENT is not None:
-        return _SUPABASE_CLIENT
     url = os.environ.get("SUPABASE_URL")
     key = os.environ.get("SUPABASE_SERVICE_ROLE_KEY")
     if not url or not key:
         return None
-    _SUPABASE_CLIENT = create_client(url, key)
-    return _SUPABASE_CLIENT
+    return create_client(url, key)
+
+
+def warm_supabase_client() -> None:
+    # Pay for the TLS handshake at boot rather than on the first assistant
+    # question.
+    supabase = get_supabase_client()
+    if not supabase:
+        return
+    try:
+        supabase.table(POS_DAILY_TABLE).select(POS_DATE_COLUMN).limit(1).execute()
+    except Exception:
+        pass
+
+
+def _forget_inherited_http_clients() -> None:
+    # A forked child must not share the parent's pooled sockets (TLS state
+    # included), so build fresh clients on first use in each process.
+    get_supabase_client.cache_clear()
+    get_openai_client.cache_clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_inherited_http_clients)
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _now_stamp() -> str:
+    # Upload folder name; formatting a struct_time skips building a datetime.
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime())
 
 
 def _safe_float(value: object) -> float:
+    # Supabase hands back JSON numbers for numeric columns, so skip the
+    # try/except machinery for the common case.
+    if isinstance(value, (int, float)):
+        return float(value)
     try:
         if value is None:
             return 0.0
@@ -238,6 +669,8 @@ def _safe_float(value: object) -> float:
 
 
 def _safe_int(value: object) -> int:
+    if isinstance(value, int):
+        return value
     try:
         if value is None:
             return 0
@@ -262,14 +695,71 @@ def summarize_submissions(rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
     return summary
 
 
+def pos_window_start() -> str:
+    return (utc_now().date() - timedelta(days=30)).isoformat()
+
+
+def pos_summary_stamp(store_id: str) -> Optional[float]:
+    """Identify the summary load_pos_summary would return right now.
+
+    0.0 when POS is not configured, the expiry of the cached entry while a
+    good summary is cached, and None when Supabase would have to be asked
+    (nothing cached yet, or the last lookup failed).
+    """
+    if not get_supabase_client():
+        return 0.0
+    with _POS_SUMMARY_LOCK:
+        cached = _POS_SUMMARY_CACHE.get((store_id, pos_window_start()))
+    if cached and cached[0] > time.monotonic():
+        return cached[0]
+    return None
+
+
 def load_pos_summary(store_id: str) -> Dict[str, Any]:
     supabase = get_supabase_client()
     if not supabase:
         return {"status": "not_configured"}
 
-    start_date = (datetime.utcnow().date() - timedelta(days=30)).isoformat()
+    start_date = pos_window_start()
+    cache_key = (store_id, start_date)
+    now = time.monotonic()
+    with _POS_SUMMARY_LOCK:
+        cached = _POS_SUMMARY_CACHE.get(cache_key)
+    if cached and cached[0] > now:
+        return cached[1]
+
+    summary = query_pos_summary(supabase, store_id, start_date)
+    if summary["status"] == "ok":
+        with _POS_SUMMARY_LOCK:
+            for key in [k for k, v in _POS_SUMMARY_CACHE.items() if v[0] <= now]:
+                del _POS_SUMMARY_CACHE[key]
+            _POS_SUMMARY_CACHE[cache_key] = (now + POS_CACHE_TTL, summary)
+    return summary
+
+
+def query_pos_summary(
+    supabase: Client, store_id: str, start_date: str
+) -> Dict[str, Any]:
+    if POS_SUMMARY_RPC and POS_TOP_ITEMS_RPC:
+        try:
+            return query_pos_summary_rpc(supabase, store_id, start_date)
+        except Exception:
+            pass  # functions not deployed; aggregate the raw rows instead
+
     summary: Dict[str, Any] = {"status": "ok", "window_start": start_date}
 
+    def fetch_item_rows() -> List[Dict[str, Any]]:
+        return (
+            supabase.table(POS_ITEM_TABLE)
+            .select("*")
+            .eq("store_id", store_id)
+            .gte(POS_ITEM_DATE_COLUMN, start_date)
+            .execute()
+            .data
+            or []
+        )
+
+    item_rows_future = _POS_QUERY_EXECUTOR.submit(fetch_item_rows)
     try:
         daily_rows = (
             supabase.table(POS_DAILY_TABLE)
@@ -283,10 +773,13 @@ def load_pos_summary(store_id: str) -> Dict[str, Any]:
     except Exception:
         return {"status": "unavailable"}
 
-    total_gross = sum(_safe_float(row.get("gross_sales")) for row in daily_rows)
-    total_net = sum(_safe_float(row.get("net_sales")) for row in daily_rows)
-    total_txn = sum(_safe_int(row.get("transactions")) for row in daily_rows)
-    total_items = sum(_safe_int(row.get("items_sold")) for row in daily_rows)
+    total_gross = total_net = 0.0
+    total_txn = total_items = 0
+    for row in daily_rows:
+        total_gross += _safe_float(row.get("gross_sales"))
+        total_net += _safe_float(row.get("net_sales"))
+        total_txn += _safe_int(row.get("transactions"))
+        total_items += _safe_int(row.get("items_sold"))
 
     summary.update(
         {
@@ -299,31 +792,22 @@ def load_pos_summary(store_id: str) -> Dict[str, Any]:
     )
 
     try:
-        item_rows = (
-            supabase.table(POS_ITEM_TABLE)
-            .select("*")
-            .eq("store_id", store_id)
-            .gte(POS_ITEM_DATE_COLUMN, start_date)
-            .execute()
-            .data
-            or []
-        )
+        item_rows = item_rows_future.result()
     except Exception:
         item_rows = []
 
     item_totals: Dict[str, Dict[str, Any]] = {}
     for row in item_rows:
         name = row.get("item_name") or row.get("item_sku") or "Unknown item"
-        item_totals.setdefault(
-            name,
-            {
+        totals = item_totals.get(name)
+        if totals is None:
+            totals = item_totals[name] = {
                 "item_name": name,
                 "quantity": 0,
                 "gross_sales": 0.0,
-            },
-        )
-        item_totals[name]["quantity"] += _safe_int(row.get("quantity"))
-        item_totals[name]["gross_sales"] += _safe_float(row.get("gross_sales"))
+            }
+        totals["quantity"] += _safe_int(row.get("quantity"))
+        totals["gross_sales"] += _safe_float(row.get("gross_sales"))
 
     top_items = sorted(
         item_totals.values(), key=lambda item: item["quantity"], reverse=True
@@ -334,16 +818,51 @@ def load_pos_summary(store_id: str) -> Dict[str, Any]:
     return summary
 
 
-def build_store_context(user: sqlite3.Row) -> Dict[str, Any]:
-    store_id = user["store_number"]
-    recent_rows = fetch_submissions(store=store_id)[:10]
+def query_pos_summary_rpc(
+    supabase: Client, store_id: str, start_date: str
+) -> Dict[str, Any]:
+    params = {"p_store_id": store_id, "p_start_date": start_date}
+    item_rows_future = _POS_QUERY_EXECUTOR.submit(
+        lambda: supabase.rpc(POS_TOP_ITEMS_RPC, {**params, "p_limit": 5})
+        .execute()
+        .data
+        or []
+    )
+    totals_rows = supabase.rpc(POS_SUMMARY_RPC, params).execute().data or []
+    totals = totals_rows[0] if totals_rows else {}
+    item_rows = item_rows_future.result()
+
+    summary: Dict[str, Any] = {
+        "status": "ok",
+        "window_start": start_date,
+        "days": _safe_int(totals.get("days")),
+        "gross_sales": round(_safe_float(totals.get("gross_sales")), 2),
+        "net_sales": round(_safe_float(totals.get("net_sales")), 2),
+        "transactions": _safe_int(totals.get("transactions")),
+        "items_sold": _safe_int(totals.get("items_sold")),
+    }
+    top_items = [
+        {
+            "item_name": row.get("item_name") or "Unknown item",
+            "quantity": _safe_int(row.get("quantity")),
+            "gross_sales": _safe_float(row.get("gross_sales")),
+        }
+        for row in item_rows
+    ]
+    if top_items:
+        summary["top_items"] = top_items
+    return summary
+
+
+def build_store_context(store_id: str) -> Dict[str, Any]:
+    recent_rows = fetch_submissions(store=store_id, limit=10, columns=SUMMARY_COLUMNS)
     activity_counts: Dict[str, int] = {}
     for row in recent_rows:
         activity_counts[row["category"]] = activity_counts.get(row["category"], 0) + 1
 
     context: Dict[str, Any] = {
         "store_id": store_id,
-        "generated_at": datetime.utcnow().isoformat(),
+        "generated_at": utc_now().isoformat(),
         "recent_activity": summarize_submissions(recent_rows),
         "activity_counts": activity_counts,
     }
@@ -353,6 +872,56 @@ def build_store_context(user: sqlite3.Row) -> Dict[str, Any]:
     return context
 
 
+@request_cached()
+def store_context_version(store_id: str) -> Tuple[int, int, Optional[float]]:
+    # Changes whenever the store gets a new submission or the POS summary
+    # cache entry is replaced; cheap enough to run on every assistant call.
+    conn = get_db_connection()
+    row = conn.execute(
+        "SELECT COUNT(*), MAX(id) FROM submissions WHERE store_number = ?",
+        (store_id,),
+    ).fetchone()
+    return row[0], row[1] or 0, pos_summary_stamp(store_id)
+
+
+def get_store_context(
+    store_id: str, version: Tuple[int, int, Optional[float]]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Return the store context and the ready-made prompt message carrying it.
+
+    Contexts are only reused while their POS summary is cached (or POS is not
+    configured); otherwise the POS lookup is retried, so an outage clears as
+    soon as Supabase answers again.
+    """
+    if version[2] is None:
+        return render_store_context(store_id)
+    return _cached_store_context(store_id, version)
+
+
+@lru_cache(maxsize=256)
+def _cached_store_context(
+    store_id: str, version: Tuple[int, int, float]
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    # The message is shared between requests for the same version; the
+    # OpenAI SDK only reads it.
+    return render_store_context(store_id)
+
+
+def render_store_context(store_id: str) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    context = build_store_context(store_id)
+    context_json = orjson.dumps(
+        context, default=str, option=orjson.OPT_NON_STR_KEYS
+    ).decode()
+    return context, input_message("system", f"Store context JSON:\n{context_json}")
+
+
+def input_message(role: str, text: str) -> Dict[str, Any]:
+    return {"role": role, "content": [{"type": "input_text", "text": text}]}
+
+
+SYSTEM_MESSAGE = input_message("system", AI_SYSTEM_PROMPT)
+
+
 def extract_output_text(response: object) -> str:
     output_text = getattr(response, "output_text", None)
     if output_text:
@@ -370,23 +939,271 @@ def extract_output_text(response: object) -> str:
     return ""
 
 
+def sse_event(data: Dict[str, Any], event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {orjson.dumps(data).decode()}\n\n"
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text; close enough to
+    # budget the prompt without shipping a tokenizer and its vocab files.
+    return len(text) // 4 + 4
+
+
+def trim_history(history: List[Any], budget: int) -> List[Dict[str, Any]]:
+    # Walk back from the newest turn and keep as many as fit in the budget.
+    turns: List[Dict[str, Any]] = []
+    for item in reversed(history[-AI_MAX_CONTEXT_ITEMS:]):
+        if not isinstance(item, dict):
+            continue
+        role = item.get("role")
+        content = (item.get("content") or "").strip()
+        if role not in {"user", "assistant"} or not content:
+            continue
+        budget -= estimate_tokens(content)
+        if budget < 0:
+            break
+        turns.append(
+            {
+                "role": role,
+                "content": [{"type": "input_text", "text": content}],
+            }
+        )
+    turns.reverse()
+    return turns
+
+
+def reply_cache_key(store_id: str, context_version: str, message: str) -> str:
+    normalized = " ".join(message.lower().split())
+    raw = f"{store_id}|{context_version}|{normalized}".encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def begin_reply(key: str) -> Tuple[Optional[str], Optional[threading.Event]]:
+    """Return a cached reply, or the event to set once this caller answers.
+
+    When the same question is already in flight the caller waits for it and
+    gets its reply; if that attempt fails both come back empty and the caller
+    asks OpenAI on its own.
+    """
+    with _REPLY_LOCK:
+        cached = _REPLY_CACHE.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1], None
+        pending = _REPLY_INFLIGHT.get(key)
+        if pending is None:
+            event = _REPLY_INFLIGHT[key] = threading.Event()
+            return None, event
+
+    # Wait as long as the leader's call can take, so a slow upstream does not
+    # turn every waiter into another OpenAI call.
+    pending.wait(AI_CALL_DEADLINE)
+    with _REPLY_LOCK:
+        cached = _REPLY_CACHE.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1], None
+    return None, None
+
+
+def finish_reply(key: str, event: threading.Event, reply: Optional[str]) -> None:
+    now = time.monotonic()
+    with _REPLY_LOCK:
+        if reply:
+            if len(_REPLY_CACHE) >= AI_REPLY_CACHE_SIZE:
+                for stale in [k for k, v in _REPLY_CACHE.items() if v[0] <= now]:
+                    del _REPLY_CACHE[stale]
+                if len(_REPLY_CACHE) >= AI_REPLY_CACHE_SIZE:
+                    _REPLY_CACHE.pop(next(iter(_REPLY_CACHE)))
+            _REPLY_CACHE[key] = (now + AI_REPLY_CACHE_TTL, reply)
+        if _REPLY_INFLIGHT.get(key) is event:
+            del _REPLY_INFLIGHT[key]
+    event.set()
+
+
+def answer_from_context(message: str, context: Dict[str, Any]) -> Optional[str]:
+    """Answer simple store questions straight from the context, or None."""
+    text = " ".join(message.lower().split()).rstrip("?!. ")
+    intent = next(
+        (name for name, pattern in _INTENT_PATTERNS if pattern.fullmatch(text)),
+        None,
+    )
+    if intent is None:
+        return None
+
+    if intent == "recent_activity":
+        activity = context.get("recent_activity") or []
+        if not activity:
+            return "No reports or shift uploads have been submitted for this store yet."
+        lines = [
+            f"- {item['created_at'][:16].replace('T', ' ')} UTC: "
+            f"{item['category'].title()} from {item['employee_name']}"
+            for item in activity[:5]
+        ]
+        return "Latest submissions:\n" + "\n".join(lines)
+
+    pos = context.get("pos_summary") or {}
+    if pos.get("status") != "ok":
+        return None  # let the model explain what data is missing
+    since = pos.get("window_start")
+    if intent == "sales":
+        return (
+            f"Since {since} ({pos.get('days', 0)} days of POS data), gross sales "
+            f"were ${pos.get('gross_sales', 0):,.2f} and net sales "
+            f"${pos.get('net_sales', 0):,.2f}."
+        )
+    if intent == "transactions":
+        return (
+            f"Since {since} there were {pos.get('transactions', 0):,} transactions "
+            f"and {pos.get('items_sold', 0):,} items sold."
+        )
+    top_items = pos.get("top_items") or []
+    if not top_items:
+        return None
+    lines = [
+        f"{rank}. {item['item_name']}: {item['quantity']:,} sold "
+        f"(${item['gross_sales']:,.2f})"
+        for rank, item in enumerate(top_items, start=1)
+    ]
+    return f"Top items since {since}:\n" + "\n".join(lines)
+
+
+def finished_reply_response(
+    reply: str, result: Dict[str, Any], stream: bool
+) -> Response:
+    """Send a reply that is already complete, in the format the caller asked for."""
+    if stream:
+        return Response(
+            sse_event({"reply": reply, **result}, "done"),
+            mimetype="text/event-stream",
+            headers=SSE_HEADERS,
+        )
+    return jsonify({"reply": reply, "response_id": None, **result})
+
+
+def stream_assistant_reply(
+    events: Any,
+    result: Dict[str, Any],
+    on_reply: Optional[Callable[[Optional[str]], None]] = None,
+) -> Iterator[str]:
+    parts: List[str] = []
+    reply: Optional[str] = None
+    try:
+        for event in events:
+            event_type = getattr(event, "type", "")
+            if event_type == "response.output_text.delta":
+                parts.append(event.delta)
+                yield sse_event({"delta": event.delta})
+            elif event_type == "response.created":
+                result["response_id"] = event.response.id
+            elif event_type in {"response.failed", "error"}:
+                raise RuntimeError(event_type)
+        reply = "".join(parts).strip()
+    except Exception:
+        yield sse_event({"error": "Assistant is temporarily unavailable."}, "error")
+        return
+    finally:
+        # Also runs when the client disconnects mid-stream: drop the upstream
+        # connection so OpenAI stops generating tokens nobody will read.
+        close = getattr(events, "close", None)
+        if close is not None:
+            close()
+        if on_reply is not None:
+            on_reply(reply)
+
+    if not reply:
+        reply = "I couldn't generate a response with the current data."
+    yield sse_event({"reply": reply, **result}, "done")
+
+
+def wants_json() -> bool:
+    """True for fetch/XHR callers that will update the page themselves."""
+    if request.headers.get("X-Requested-With") == "XMLHttpRequest":
+        return True
+    return request.accept_mimetypes.best == "application/json"
+
+
+def upload_response(
+    message: str, category: str, submission: Optional[Dict[str, Any]] = None
+) -> Any:
+    """Answer an upload form: JSON for scripted submits, flash + redirect
+    for plain form posts."""
+    if wants_json():
+        ok = category == "success"
+        body: Dict[str, Any] = {"ok": ok, "message": message}
+        if submission is not None:
+            body["submission"] = submission
+        return jsonify(body), 200 if ok else 400
+    flash(message, category)
+    return redirect(url_for("dashboard"))
+
+
+def submission_preview(
+    user: Dict[str, Any], category: str, payload: Dict[str, Any]
+) -> Dict[str, Any]:
+    """The fields the dashboards show for a submission, without a DB read."""
+    return {
+        "store_number": user["store_number"],
+        "employee_name": user["name"],
+        "category": category,
+        "created_at": utc_now().isoformat(),
+        "notes": payload.get("notes", ""),
+        "files": [
+            url_for("download_file", filename=file["stored_name"])
+            for file in payload.get("files", [])
+        ],
+    }
+
+
+@lru_cache(maxsize=4096)
+def locate_upload(filename: str, second: int) -> Tuple[int, Optional[Path]]:
+    """Map a download name to its path relative to UPLOAD_ROOT.
+
+    Returns (200, path), (400, None) or (404, None). ``second`` is the
+    current monotonic second, so hot files skip the resolve()/stat() calls
+    and a result is reused for at most about a second.
+    """
+    # Canonicalise once: this rejects "..", absolute paths and symlinks
+    # that escape the upload folder in a single check.
+    file_path = (UPLOAD_ROOT_RESOLVED / filename).resolve()
+    if not file_path.is_relative_to(UPLOAD_ROOT_RESOLVED):
+        return 400, None
+    if not file_path.is_file():
+        return 404, None
+    return 200, file_path.relative_to(UPLOAD_ROOT_RESOLVED)
+
+
 def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    return _ALLOWED_FILE_RE.search(filename) is not None
 
 
 def save_uploaded_files(files: Dict[str, object]) -> List[Dict[str, str]]:
-    saved_files = []
-    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    # Check every file before writing any, so a rejected upload leaves
+    # nothing behind on disk.
+    uploads = []
     for field_name, file in files.items():
         if not file or not getattr(file, "filename", ""):
             continue
         filename = secure_filename(file.filename)
         if not allowed_file(filename):
             raise ValueError(f"Unsupported file type for {filename}")
-        file_dir = UPLOAD_ROOT / timestamp
-        file_dir.mkdir(parents=True, exist_ok=True)
+        uploads.append((field_name, file, filename))
+    if not uploads:
+        return []
+
+    saved_files = []
+    timestamp = _now_stamp()
+    file_dir = UPLOAD_ROOT / timestamp
+    file_dir.mkdir(parents=True, exist_ok=True)
+    for field_name, file, filename in uploads:
         file_path = file_dir / filename
-        file.save(file_path)
+        spool_name = getattr(file.stream, "name", None)
+        if isinstance(spool_name, str) and spool_name in request.upload_spools:
+            file.stream.flush()
+            # mkstemp creates 0600 files; match what FileStorage.save writes.
+            os.chmod(spool_name, 0o644)
+            os.replace(spool_name, file_path)
+        else:
+            file.save(file_path, buffer_size=UPLOAD_COPY_BUFFER_SIZE)
         saved_files.append(
             {
                 "field": field_name,
@@ -398,35 +1215,227 @@ def save_uploaded_files(files: Dict[str, object]) -> List[Dict[str, str]]:
     return saved_files
 
 
-def store_submission(
-    user: sqlite3.Row,
+def queue_submission(
+    user: Dict[str, Any],
     category: str,
     report_type: str,
     notes: str,
     payload: Dict[str, object],
+    inline: bool = False,
 ) -> None:
-    conn = get_db_connection()
-    conn.execute(
-        """
-        INSERT INTO submissions (
-            user_id, employee_name, store_number,
-            category, report_type, notes, payload, created_at
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (
-            user["id"],
-            user["name"],
-            user["store_number"],
-            category,
-            report_type,
-            notes,
-            json.dumps(payload),
-            datetime.utcnow().isoformat(),
-        ),
+    """Record a submission without making the request wait on SQLite.
+
+    Rows are written in batches by this process's writer thread. They are
+    written inline when ``inline`` is set (the caller is about to show the
+    row), on Vercel (which freezes the function once the response is sent)
+    and during shutdown.
+    """
+    params = (
+        user["id"],
+        user["name"],
+        user["store_number"],
+        category,
+        report_type,
+        notes,
+        orjson.dumps(payload).decode(),
+        utc_now().isoformat(),
     )
-    conn.commit()
-    conn.close()
+    if inline or IS_VERCEL or not _enqueue_submission(params):
+        insert_submissions([params])
+
+
+def _enqueue_submission(params: Tuple[Any, ...]) -> bool:
+    with _SUBMISSION_WRITER_LOCK:
+        if not start_submission_writer():
+            return False
+        _SUBMISSION_QUEUE.put_nowait(params)
+        return True
+
+
+def insert_submissions(rows: Sequence[Tuple[Any, ...]]) -> None:
+    with db_transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO submissions (
+                user_id, employee_name, store_number,
+                category, report_type, notes, payload, created_at
+            )
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            rows,
+        )
+
+
+def _drain_submission_queue() -> None:
+    while True:
+        batch = [_SUBMISSION_QUEUE.get()]
+        deadline = time.monotonic() + SUBMISSION_FLUSH_INTERVAL
+        while len(batch) < SUBMISSION_BATCH_SIZE and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_SUBMISSION_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        rows = [row for row in batch if row is not None]
+        if rows:
+            write_submission_batch(rows)
+        if len(rows) < len(batch):
+            return
+
+
+def write_submission_batch(rows: Sequence[Tuple[Any, ...]]) -> None:
+    """Insert a batch, falling back to one row at a time if it fails.
+
+    A bad row or a busy database then only costs the rows that really fail.
+    """
+    try:
+        insert_submissions(rows)
+        return
+    except Exception:
+        logger.warning(
+            "Batch of %d submissions failed; retrying row by row",
+            len(rows),
+            exc_info=True,
+        )
+    for row in rows:
+        _insert_submission_with_retry(row)
+
+
+def _insert_submission_with_retry(row: Tuple[Any, ...]) -> None:
+    for attempt in range(1, SUBMISSION_WRITE_ATTEMPTS + 1):
+        try:
+            insert_submissions([row])
+            return
+        except sqlite3.OperationalError:
+            if attempt == SUBMISSION_WRITE_ATTEMPTS:
+                break
+            time.sleep(0.5 * attempt)
+        except Exception:
+            break
+    # The uploaded files are already on disk; log the full row so it can be
+    # restored by hand.
+    logger.exception("Could not write submission %r", row)
+
+
+def start_submission_writer() -> bool:
+    """Make sure this process has a live writer thread.
+
+    Called lazily on every enqueue, so processes forked after import (e.g.
+    gunicorn --preload) start their own. Returns False after shutdown.
+    """
+    global _SUBMISSION_WRITER
+    with _SUBMISSION_WRITER_LOCK:
+        if _SUBMISSIONS_CLOSED:
+            return False
+        if _SUBMISSION_WRITER is None or not _SUBMISSION_WRITER.is_alive():
+            _SUBMISSION_WRITER = threading.Thread(
+                target=_drain_submission_queue,
+                name="hiremote-submissions",
+                daemon=True,
+            )
+            _SUBMISSION_WRITER.start()
+        return True
+
+
+def stop_submission_writer() -> None:
+    """Write whatever is still queued and stop the writer thread."""
+    global _SUBMISSION_WRITER, _SUBMISSIONS_CLOSED
+    with _SUBMISSION_WRITER_LOCK:
+        _SUBMISSIONS_CLOSED = True
+        writer, _SUBMISSION_WRITER = _SUBMISSION_WRITER, None
+        if writer is not None and writer.is_alive():
+            _SUBMISSION_QUEUE.put(None)
+        else:
+            writer = None
+    if writer is not None:
+        writer.join(timeout=10)
+
+    # Rows a dead or overrunning writer left behind.
+    leftover = []
+    with suppress(queue.Empty):
+        while True:
+            row = _SUBMISSION_QUEUE.get_nowait()
+            if row is not None:
+                leftover.append(row)
+    if leftover:
+        write_submission_batch(leftover)
+
+
+def _reset_submission_writer() -> None:
+    # A forked child inherits the parent's queued rows (the parent still
+    # writes those) and its lock state, but not the writer thread.
+    global _SUBMISSION_QUEUE, _SUBMISSION_WRITER, _SUBMISSION_WRITER_LOCK
+    _SUBMISSION_QUEUE = queue.Queue()
+    _SUBMISSION_WRITER = None
+    _SUBMISSION_WRITER_LOCK = threading.RLock()
+
+
+atexit.register(stop_submission_writer)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_submission_writer)
+
+
+class ReportsFilter(BaseModel):
+    """Query-string filters for the reporting workspace."""
+
+    model_config = ConfigDict(frozen=True, str_strip_whitespace=True)
+
+    category: Optional[str] = None
+    employee: Optional[str] = None
+    store_number: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    cursor: Optional[int] = None
+    limit: int = REPORTS_PAGE_SIZE
+
+    @field_validator("start", "end")
+    @classmethod
+    def _as_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        # datetime-local inputs carry no zone; the UI shows times in UTC.
+        if value is None:
+            return None
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+
+    @field_validator("limit")
+    @classmethod
+    def _clamp_limit(cls, value: int) -> int:
+        return min(max(value, 1), REPORTS_MAX_PAGE_SIZE)
+
+    @classmethod
+    def from_args(cls, args: Any) -> Tuple["ReportsFilter", List[str]]:
+        """Validate request args, dropping (and naming) any invalid fields."""
+        data = {
+            name: value
+            for name, value in args.items()
+            if name in cls.model_fields and value.strip()
+        }
+        try:
+            return cls.model_validate(data), []
+        except ValidationError as exc:
+            invalid = sorted({str(error["loc"][0]) for error in exc.errors()})
+            for name in invalid:
+                data.pop(name, None)
+            return cls.model_validate(data), invalid
+
+    def form_values(self) -> Dict[str, str]:
+        """Filter values as the form inputs (and pagination links) expect."""
+        values = {
+            "category": self.category or "",
+            "employee": self.employee or "",
+            "start": "",
+            "end": "",
+            "store_number": self.store_number or "",
+        }
+        if self.start:
+            values["start"] = self.start.strftime("%Y-%m-%dT%H:%M")
+        if self.end:
+            values["end"] = self.end.strftime("%Y-%m-%dT%H:%M")
+        return values
 
 
 def fetch_submissions(
@@ -435,8 +1444,11 @@ def fetch_submissions(
     employee: Optional[str] = None,
     start: Optional[str] = None,
     end: Optional[str] = None,
+    after_id: Optional[int] = None,
+    limit: Optional[int] = None,
+    columns: Sequence[str] = ("*",),
 ) -> List[sqlite3.Row]:
-    query = "SELECT * FROM submissions WHERE 1=1"
+    query = f"SELECT {', '.join(columns)} FROM submissions WHERE 1=1"
     params: List[object] = []
     if store:
         query += " AND store_number = ?"
@@ -453,12 +1465,47 @@ def fetch_submissions(
     if end:
         query += " AND created_at <= ?"
         params.append(end)
-    query += " ORDER BY datetime(created_at) DESC"
+    if after_id is not None:
+        # Keyset pagination: continue strictly after the cursor row in
+        # (created_at, id) order instead of paying for an OFFSET skip.
+        query += (
+            " AND (created_at, id) <"
+            " (SELECT created_at, id FROM submissions WHERE id = ?)"
+        )
+        params.append(after_id)
+    # created_at is stored as ISO-8601 UTC, so plain text ordering matches
+    # chronological ordering and lets SQLite walk the index instead of sorting.
+    query += " ORDER BY created_at DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT ?"
+        params.append(limit)
+
+    conn = get_db_connection()
+    return conn.execute(query, params).fetchall()
+
+
+def count_submissions() -> int:
+    conn = get_db_connection()
+    return conn.execute("SELECT COUNT(*) FROM submissions").fetchone()[0]
 
+
+def fetch_store_numbers() -> List[str]:
     conn = get_db_connection()
-    rows = conn.execute(query, params).fetchall()
-    conn.close()
-    return rows
+    rows = conn.execute(
+        "SELECT DISTINCT store_number FROM submissions ORDER BY store_number"
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+@lru_cache(maxsize=4096)
+def parse_payload(payload: str) -> Dict[str, Any]:
+    # Stored payloads never change, so the same row re-rendered across
+    # dashboards and requests only needs decoding once. Callers must treat
+    # the result as read-only.
+    try:
+        return orjson.loads(payload)
+    except orjson.JSONDecodeError:
+        return {}
 
 
 def register_routes(app: Flask) -> None:
@@ -466,10 +1513,7 @@ def register_routes(app: Flask) -> None:
     def load_payload(payload: Optional[str]):
         if not payload:
             return {}
-        try:
-            return json.loads(payload)
-        except json.JSONDecodeError:
-            return {}
+        return parse_payload(payload)
 
     @app.context_processor
     def inject_globals():
@@ -490,9 +1534,8 @@ def register_routes(app: Flask) -> None:
             user = conn.execute(
                 "SELECT * FROM users WHERE email = ?", (email,)
             ).fetchone()
-            conn.close()
             if user and check_password_hash(user["password_hash"], password):
-                session["user_id"] = user["id"]
+                remember_user(user)
                 flash("Welcome back!", "success")
                 return redirect(url_for("dashboard"))
             flash("Invalid email or password.", "danger")
@@ -515,18 +1558,18 @@ def register_routes(app: Flask) -> None:
                 store=user["store_number"],
                 category="shift",
                 employee=user["name"],
-            )[:5]
+                limit=5,
+            )
             return render_template(
                 "dashboard_employee.html",
                 submissions=submissions,
             )
         if user["role"] == ROLE_IRONHAND:
-            reports = fetch_submissions()
-            stores = sorted({row["store_number"] for row in reports})
             return render_template(
                 "dashboard_ironhand.html",
-                reports=reports,
-                stores=stores,
+                reports=fetch_submissions(limit=6),
+                total_submissions=count_submissions(),
+                stores=fetch_store_numbers(),
             )
         if user["role"] == ROLE_CLIENT:
             return redirect(url_for("client_reports"))
@@ -537,29 +1580,35 @@ def register_routes(app: Flask) -> None:
     def upload_shift():
         user = current_user()
         notes = request.form.get("notes", "")
-        try:
-            saved_files = save_uploaded_files(
-                {
-                    "scratcher_video": request.files.get("scratcher_video"),
-                    "cash_photo": request.files.get("cash_photo"),
-                    "sales_photo": request.files.get("sales_photo"),
-                }
+        shift_files = {
+            "scratcher_video": request.files.get("scratcher_video"),
+            "cash_photo": request.files.get("cash_photo"),
+            "sales_photo": request.files.get("sales_photo"),
+        }
+        if not all(file and file.filename for file in shift_files.values()):
+            return upload_response(
+                "All three files are required for end-of-shift upload.", "danger"
             )
-        except ValueError as exc:
-            flash(str(exc), "danger")
-            return redirect(url_for("dashboard"))
 
-        if len(saved_files) < 3:
-            flash("All three files are required for end-of-shift upload.", "danger")
-            return redirect(url_for("dashboard"))
+        try:
+            saved_files = save_uploaded_files(shift_files)
+        except ValueError as exc:
+            return upload_response(str(exc), "danger")
 
         payload = {
             "files": saved_files,
             "notes": notes,
         }
-        store_submission(user, "shift", "shift", notes, payload)
-        flash("Shift submitted. Great work!", "success")
-        return redirect(url_for("dashboard"))
+        # Plain form posts redirect straight to a dashboard listing the row;
+        # only scripted submits (which render it themselves) can write behind.
+        queue_submission(
+            user, "shift", "shift", notes, payload, inline=not wants_json()
+        )
+        return upload_response(
+            "Shift submitted. Great work!",
+            "success",
+            submission_preview(user, "shift", payload),
+        )
 
     @app.route("/upload/report", methods=["POST"])
     @login_required(ROLE_IRONHAND)
@@ -575,16 +1624,20 @@ def register_routes(app: Flask) -> None:
             try:
                 files = save_uploaded_files({"report_file": file_payload})
             except ValueError as exc:
-                flash(str(exc), "danger")
-                return redirect(url_for("dashboard"))
+                return upload_response(str(exc), "danger")
 
         payload = {
             "summary": summary,
             "files": files,
         }
-        store_submission(user, report_type, report_type, notes, payload)
-        flash(f"{report_type.title()} report sent!", "success")
-        return redirect(url_for("dashboard"))
+        queue_submission(
+            user, report_type, report_type, notes, payload, inline=not wants_json()
+        )
+        return upload_response(
+            f"{report_type.title()} report sent!",
+            "success",
+            submission_preview(user, report_type, payload),
+        )
 
     @app.route("/reports")
     @login_required()
@@ -595,32 +1648,46 @@ def register_routes(app: Flask) -> None:
         if user["role"] not in {ROLE_CLIENT, ROLE_IRONHAND}:
             abort(403)
 
-        category = request.args.get("category") or None
-        employee = request.args.get("employee") or None
-        start = request.args.get("start") or None
-        end = request.args.get("end") or None
-        store_number = request.args.get("store_number") or None
-
+        report_filter, invalid = ReportsFilter.from_args(request.args)
+        if invalid:
+            flash(f"Ignored invalid filter: {', '.join(invalid)}.", "warning")
         if user["role"] == ROLE_CLIENT:
-            store_number = user["store_number"]
+            report_filter = report_filter.model_copy(
+                update={"store_number": user["store_number"]}
+            )
+
+        cursor = report_filter.cursor
+        page_size = report_filter.limit
 
+        # Ask for one extra row to learn whether an older page exists. Bounds
+        # go in as ISO-8601 UTC, the format created_at is stored in.
         submissions = fetch_submissions(
-            store=store_number,
-            category=category,
-            employee=employee,
-            start=start,
-            end=end,
+            store=report_filter.store_number,
+            category=report_filter.category,
+            employee=report_filter.employee,
+            start=report_filter.start.isoformat() if report_filter.start else None,
+            end=report_filter.end.isoformat() if report_filter.end else None,
+            after_id=cursor,
+            limit=page_size + 1,
         )
+        filters = report_filter.form_values()
+        active_filters = {key: value for key, value in filters.items() if value}
+        next_url = None
+        if len(submissions) > page_size:
+            submissions = submissions[:page_size]
+            next_url = url_for(
+                "client_reports",
+                cursor=submissions[-1]["id"],
+                limit=page_size,
+                **active_filters,
+            )
+        first_url = url_for("client_reports", **active_filters) if cursor else None
         return render_template(
             "dashboard_client.html",
             submissions=submissions,
-            filters={
-                "category": category or "",
-                "employee": employee or "",
-                "start": start or "",
-                "end": end or "",
-                "store_number": store_number or "",
-            },
+            filters=filters,
+            next_url=next_url,
+            first_url=first_url,
         )
 
     @app.route("/api/assistant", methods=["POST"])
@@ -638,91 +1705,162 @@ def register_routes(app: Flask) -> None:
         history = payload.get("history") or []
         if not isinstance(history, list):
             history = []
+        previous_response_id = payload.get("previous_response_id")
+        if not isinstance(previous_response_id, str):
+            previous_response_id = None
+
+        store_id = user["store_number"]
+        version = store_context_version(store_id)
+        context_version = ".".join(str(part) for part in version)
+        context, context_message = get_store_context(store_id, version)
+        result: Dict[str, Any] = {
+            "pos_status": context.get("pos_summary", {}).get("status"),
+            "context_version": context_version,
+        }
 
-        context = build_store_context(user)
-        client = get_openai_client()
-        if not client:
-            return (
-                jsonify(
-                    {
-                        "error": "OpenAI API key is not configured for this environment."
-                    }
-                ),
-                500,
+        context_text = context_message["content"][0]["text"]
+        turns: List[Dict[str, Any]] = []
+        if not previous_response_id:
+            budget = AI_MAX_INPUT_TOKENS - sum(
+                estimate_tokens(text)
+                for text in (AI_SYSTEM_PROMPT, context_text, message)
             )
+            turns = trim_history(history, budget)
 
-        system_prompt = (
-            "You are the Iron Hand store assistant. Answer only using the provided "
-            "store context. If the answer is not available, say you do not have that "
-            "data yet and suggest what data would be needed. Keep responses concise "
-            "and action-oriented."
-        )
-
-        messages: List[Dict[str, Any]] = [
-            {
-                "role": "system",
-                "content": [{"type": "input_text", "text": system_prompt}],
-            },
-            {
-                "role": "system",
-                "content": [
-                    {
-                        "type": "input_text",
-                        "text": f"Store context JSON:\n{json.dumps(context, default=str)}",
-                    }
-                ],
-            },
-        ]
-
-        for item in history[-AI_MAX_CONTEXT_ITEMS:]:
-            role = item.get("role")
-            content = (item.get("content") or "").strip()
-            if role not in {"user", "assistant"} or not content:
-                continue
-            messages.append(
-                {
-                    "role": role,
-                    "content": [{"type": "input_text", "text": content}],
-                }
+        local_reply = answer_from_context(message, context)
+        if local_reply is not None:
+            return finished_reply_response(
+                local_reply, result, bool(payload.get("stream"))
             )
 
-        messages.append(
-            {"role": "user", "content": [{"type": "input_text", "text": message}]}
-        )
-
+        # Opening questions only depend on the store context, so identical ones
+        # from the same store can share a single OpenAI call.
+        reply_key: Optional[str] = None
+        reply_event: Optional[threading.Event] = None
+        if not previous_response_id and not turns:
+            reply_key = reply_cache_key(store_id, context_version, message)
+            cached_reply, reply_event = begin_reply(reply_key)
+            if cached_reply is not None:
+                return finished_reply_response(
+                    cached_reply, result, bool(payload.get("stream"))
+                )
+
+        settled = False
+
+        def on_reply(reply: Optional[str]) -> None:
+            # Releases waiters on this question; only the first call counts.
+            nonlocal settled
+            if reply_key and reply_event and not settled:
+                settled = True
+                finish_reply(reply_key, reply_event, reply)
+
+        # Until the response (or the stream generator) owns on_reply, any
+        # failure must release the in-flight slot or identical questions would
+        # wait out AI_CALL_DEADLINE.
         try:
-            response = client.responses.create(
-                model=AI_MODEL,
-                input=messages,
-                metadata={
-                    "store_id": str(user["store_number"]),
-                    "user_id": str(user["id"]),
-                },
-            )
-        except Exception:
-            return jsonify({"error": "Assistant is temporarily unavailable."}), 502
+            client = get_openai_client()
+            if not client:
+                on_reply(None)
+                return (
+                    jsonify(
+                        {
+                            "error": "OpenAI API key is not configured for this environment."
+                        }
+                    ),
+                    500,
+                )
+
+            user_message = input_message("user", message)
+
+            messages: List[Dict[str, Any]]
+            if previous_response_id:
+                # OpenAI already holds the earlier turns (and the context they
+                # saw); only resend the context when the store data changed.
+                messages = []
+                if payload.get("context_version") != context_version:
+                    messages.append(context_message)
+                messages.append(user_message)
+            else:
+                messages = [
+                    SYSTEM_MESSAGE,
+                    context_message,
+                    *turns,
+                    user_message,
+                ]
+
+            request_options: Dict[str, Any] = {
+                "model": AI_MODEL,
+                "input": messages,
+                "metadata": user["ai_metadata"],
+            }
+            if previous_response_id:
+                request_options["previous_response_id"] = previous_response_id
+
+            if payload.get("stream"):
+                try:
+                    events = client.responses.create(stream=True, **request_options)
+                except Exception:
+                    on_reply(None)
+                    return (
+                        jsonify({"error": "Assistant is temporarily unavailable."}),
+                        502,
+                    )
+                streamed = Response(
+                    stream_assistant_reply(events, result, on_reply),
+                    mimetype="text/event-stream",
+                    headers=SSE_HEADERS,
+                )
+                # A generator closed before its first chunk never runs its
+                # finally block.
+                streamed.call_on_close(lambda: on_reply(None))
+                return streamed
+
+            reply = None
+            try:
+                response = client.responses.create(**request_options)
+                reply = extract_output_text(response).strip()
+            except Exception:
+                return jsonify({"error": "Assistant is temporarily unavailable."}), 502
+            finally:
+                on_reply(reply)
 
-        reply = extract_output_text(response).strip()
-        if not reply:
-            reply = "I couldn't generate a response with the current data."
+            if not reply:
+                reply = "I couldn't generate a response with the current data."
 
-        return jsonify(
-            {
-                "reply": reply,
-                "pos_status": context.get("pos_summary", {}).get("status"),
-            }
-        )
+            return jsonify(
+                {
+                    "reply": reply,
+                    "response_id": getattr(response, "id", None),
+                    **result,
+                }
+            )
+        except BaseException:
+            on_reply(None)
+            raise
 
     @app.route("/files/<path:filename>")
     @login_required()
     def download_file(filename: str):
-        safe_path = Path(filename)
-        if safe_path.is_absolute() or ".." in safe_path.parts:
-            abort(400)
-        file_path = UPLOAD_ROOT / safe_path
-        if not file_path.exists():
-            abort(404)
-        return send_from_directory(UPLOAD_ROOT, str(safe_path))
+        status, safe_path = locate_upload(filename, int(time.monotonic()))
+        if safe_path is None:
+            abort(status)
+        if UPLOAD_ACCEL_PREFIX:
+            response = make_response("")
+            response.headers["X-Accel-Redirect"] = (
+                UPLOAD_ACCEL_PREFIX.rstrip("/") + "/" + quote(safe_path.as_posix())
+            )
+            response.mimetype = (
+                mimetypes.guess_type(safe_path.name)[0] or "application/octet-stream"
+            )
+        else:
+            response = send_from_directory(
+                UPLOAD_ROOT_RESOLVED, str(safe_path), max_age=UPLOAD_CACHE_MAX_AGE
+            )
+        # Files sit behind login; keep them out of shared caches.
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.max_age = UPLOAD_CACHE_MAX_AGE
+        return response
 
 
 app = create_app()
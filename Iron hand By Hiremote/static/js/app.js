@@ -17,6 +17,110 @@ document.addEventListener("DOMContentLoaded", () => {
     });
   });
 
+  const showFlash = (message, category) => {
+    let region = document.querySelector(".flash-region");
+    if (!region) {
+      region = document.createElement("div");
+      region.classList.add("flash-region");
+      document.querySelector("main.page").prepend(region);
+    }
+    const flash = document.createElement("div");
+    flash.classList.add("flash", category);
+    flash.textContent = message;
+    region.replaceChildren(flash);
+  };
+
+  const formatStamp = (stamp) => stamp.slice(0, 16).replace("T", " ");
+
+  // Mirror the dashboard templates so a new upload shows up without a reload.
+  const recentRenderers = {
+    shift: (container, submission) => {
+      let list = container.querySelector(".submissions");
+      if (!list) {
+        list = document.createElement("ul");
+        list.classList.add("submissions");
+        container.appendChild(list);
+      }
+      const item = document.createElement("li");
+      const stamp = document.createElement("strong");
+      stamp.textContent = `${formatStamp(submission.created_at)} UTC`;
+      const files = document.createElement("small");
+      files.textContent = `Files: ${submission.files.length}`;
+      item.append(stamp, files);
+      if (submission.notes) {
+        const notes = document.createElement("p");
+        notes.textContent = submission.notes;
+        item.appendChild(notes);
+      }
+      list.prepend(item);
+    },
+    report: (container, submission) => {
+      const row = document.createElement("div");
+      row.classList.add("table-row");
+      const category =
+        submission.category.charAt(0).toUpperCase() + submission.category.slice(1);
+      [
+        submission.store_number,
+        category,
+        submission.employee_name,
+        formatStamp(submission.created_at),
+      ].forEach((text) => {
+        const cell = document.createElement("div");
+        cell.textContent = text;
+        row.appendChild(cell);
+      });
+      const files = document.createElement("div");
+      submission.files.forEach((url, index) => {
+        const link = document.createElement("a");
+        link.href = url;
+        link.textContent = `File ${index + 1}`;
+        files.append(link, " ");
+      });
+      row.appendChild(files);
+      container.querySelector(".table-header").after(row);
+      const total = document.querySelector("[data-total-submissions]");
+      if (total) {
+        total.textContent = Number(total.textContent) + 1;
+      }
+    },
+  };
+
+  // Submit uploads in the background; the server answers with JSON instead
+  // of redirecting to a fresh dashboard render.
+  document.querySelectorAll("form[data-async-upload]").forEach((form) => {
+    form.addEventListener("submit", async (event) => {
+      event.preventDefault();
+      const kind = form.dataset.asyncUpload;
+      const button = form.querySelector('button[type="submit"]');
+      button.disabled = true;
+      try {
+        const response = await fetch(form.action, {
+          method: "POST",
+          body: new FormData(form),
+          headers: {
+            Accept: "application/json",
+            "X-Requested-With": "XMLHttpRequest",
+          },
+        });
+        const result = await response.json();
+        showFlash(result.message, result.ok ? "success" : "danger");
+        if (result.ok) {
+          form.reset();
+          form.querySelectorAll(".file-helper").forEach((helper) => helper.remove());
+          const container = document.querySelector(`[data-recent="${kind}"]`);
+          if (container && result.submission) {
+            container.querySelectorAll("[data-empty]").forEach((el) => el.remove());
+            recentRenderers[kind](container, result.submission);
+          }
+        }
+      } catch (error) {
+        showFlash("Upload failed. Check your connection and try again.", "danger");
+      } finally {
+        button.disabled = false;
+      }
+    });
+  });
+
   const assistantToggle = document.getElementById("assistant-toggle");
   if (!assistantToggle) {
     return;
@@ -30,6 +134,13 @@ document.addEventListener("DOMContentLoaded", () => {
   const voiceButton = document.getElementById("assistant-voice");
 
   const history = [];
+  // Lets the server continue the OpenAI conversation instead of resending
+  // the store context and history every turn.
+  let lastResponseId = null;
+  let contextVersion = null;
+  // The in-flight assistant request, aborted when the modal closes or a new
+  // message is sent so the server stops streaming a reply nobody reads.
+  let activeRequest = null;
   let voiceMode = false;
   let listening = false;
   const SpeechRecognition =
@@ -68,11 +179,20 @@ document.addEventListener("DOMContentLoaded", () => {
     return bubble;
   };
 
+  const cancelActiveRequest = () => {
+    if (activeRequest) {
+      activeRequest.abort();
+      activeRequest = null;
+    }
+  };
+
   const setModalOpen = (open) => {
     assistantModal.classList.toggle("active", open);
     assistantModal.setAttribute("aria-hidden", open ? "false" : "true");
     if (open) {
       assistantInput.focus();
+    } else {
+      cancelActiveRequest();
     }
   };
 
@@ -84,33 +204,108 @@ document.addEventListener("DOMContentLoaded", () => {
     }
   });
 
+  // Parses a text/event-stream body, calling onEvent(name, data) per event.
+  const readEventStream = async (response, onEvent) => {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf("\n\n");
+      while (boundary !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let name = "message";
+        let data = "";
+        rawEvent.split("\n").forEach((line) => {
+          if (line.startsWith("event:")) {
+            name = line.slice(6).trim();
+          } else if (line.startsWith("data:")) {
+            data += line.slice(5).trim();
+          }
+        });
+        if (data) {
+          onEvent(name, JSON.parse(data));
+        }
+        boundary = buffer.indexOf("\n\n");
+      }
+    }
+  };
+
   const sendMessage = async (text) => {
     if (!text) {
       return;
     }
     appendMessage("user", text);
+    // The server appends the new message itself; send only earlier turns.
+    const priorTurns = history.slice(-20);
     history.push({ role: "user", content: text });
     assistantInput.value = "";
 
     const loadingBubble = appendMessage("assistant", "Thinking...");
+    cancelActiveRequest();
+    const controller = new AbortController();
+    activeRequest = controller;
 
     try {
       const response = await fetch("/api/assistant", {
         method: "POST",
+        signal: controller.signal,
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           message: text,
-          history: history.slice(-6),
+          history: priorTurns,
+          previous_response_id: lastResponseId,
+          context_version: contextVersion,
+          stream: true,
         }),
       });
-      const data = await response.json();
-      const reply = data.reply || "I couldn't find that information yet.";
+      let reply = "";
+      let result = {};
+      const contentType = response.headers.get("Content-Type") || "";
+      if (contentType.startsWith("text/event-stream")) {
+        await readEventStream(response, (name, data) => {
+          if (name === "done") {
+            reply = data.reply;
+            result = data;
+          } else if (name === "error") {
+            reply = data.error;
+          } else {
+            reply += data.delta || "";
+          }
+          loadingBubble.textContent = reply;
+        });
+      } else {
+        result = await response.json();
+        reply = result.reply;
+      }
+      lastResponseId = result.response_id || null;
+      contextVersion = result.context_version || null;
+      reply = reply || "I couldn't find that information yet.";
       loadingBubble.textContent = reply;
       history.push({ role: "assistant", content: reply });
       speakText(reply);
     } catch (error) {
+      if (error.name === "AbortError") {
+        // Keep whatever text already streamed in; the conversation state
+        // is unchanged because the cancelled reply was never completed.
+        if (loadingBubble.textContent === "Thinking...") {
+          loadingBubble.textContent = "Stopped.";
+        }
+        return;
+      }
+      lastResponseId = null;
+      contextVersion = null;
       loadingBubble.textContent =
         "Sorry, I ran into an error while reaching the assistant.";
+    } finally {
+      if (activeRequest === controller) {
+        activeRequest = null;
+      }
     }
   };
 
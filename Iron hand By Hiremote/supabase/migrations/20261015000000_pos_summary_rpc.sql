@@ -0,0 +1,54 @@
+-- Aggregate POS data inside Postgres so the portal fetches one summary row
+-- (plus the top items) instead of every daily/item row in the window.
+-- Table and column names match the app defaults (POS_DAILY_TABLE,
+-- POS_ITEM_TABLE, POS_DATE_COLUMN, POS_ITEM_DATE_COLUMN); adjust them here if
+-- those environment variables are overridden.
+
+create index if not exists pos_daily_sales_store_date_idx
+    on public.pos_daily_sales (store_id, business_date);
+
+create index if not exists pos_item_sales_store_date_idx
+    on public.pos_item_sales (store_id, business_date);
+
+create or replace function public.pos_summary(p_store_id text, p_start_date date)
+returns table (
+    days bigint,
+    gross_sales numeric,
+    net_sales numeric,
+    transactions bigint,
+    items_sold bigint
+)
+language sql
+stable
+as $$
+    select
+        count(*),
+        coalesce(sum(gross_sales), 0),
+        coalesce(sum(net_sales), 0),
+        coalesce(sum(transactions), 0),
+        coalesce(sum(items_sold), 0)
+    from public.pos_daily_sales
+    where store_id = p_store_id
+      and business_date >= p_start_date;
+$$;
+
+create or replace function public.pos_top_items(
+    p_store_id text,
+    p_start_date date,
+    p_limit integer default 5
+)
+returns table (item_name text, quantity bigint, gross_sales numeric)
+language sql
+stable
+as $$
+    select
+        coalesce(nullif(item_name, ''), nullif(item_sku, ''), 'Unknown item'),
+        coalesce(sum(quantity), 0),
+        coalesce(sum(gross_sales), 0)
+    from public.pos_item_sales
+    where store_id = p_store_id
+      and business_date >= p_start_date
+    group by 1
+    order by 2 desc
+    limit p_limit;
+$$;